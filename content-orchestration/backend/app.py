@@ -3,19 +3,31 @@ import os  # Used for interacting with the operating system, like reading enviro
 import json  # Used for working with JSON data.
 import logging  # Used for logging application events for debugging and monitoring.
 import uuid  # Used for generating unique IDs (UUIDs) for new users.
-import io  # Used to handle in-memory binary streams, for file downloads.
 import zipfile  # Used for creating and reading ZIP archives, for multi-file downloads.
+import mmap  # Used to upload large spooled files without copying them into memory.
+import itertools  # Used to slice iterators when prefetching downloads.
+import threading  # Used to guard shared in-process caches across request threads.
 from datetime import timedelta  # Used to set the expiration time for JWTs.
+from collections import deque  # Used as an ordered window of in-flight downloads.
+from concurrent.futures import ThreadPoolExecutor  # Used to run independent network calls (GCS, Firestore) concurrently.
 
 # --- Third-party Library Imports ---
-from flask import Flask, request, jsonify, Blueprint, current_app, render_template, send_from_directory, send_file  # Core components of the Flask web framework.
+from flask import Flask, Response, request, jsonify, Blueprint, current_app, redirect, render_template, send_from_directory, send_file  # Core components of the Flask web framework.
+from cachetools import TTLCache  # In-memory cache with per-entry expiry, used for user lookups.
 from flask_cors import CORS  # Handles Cross-Origin Resource Sharing (CORS) to allow requests from the frontend.
 from dotenv import load_dotenv  # Loads environment variables from a .env file for local development.
-from werkzeug.security import generate_password_hash, check_password_hash  # Used for securely hashing and verifying user passwords.
+from argon2 import PasswordHasher  # Argon2 (C implementation) for hashing and verifying user passwords.
+from argon2.exceptions import InvalidHashError, VerifyMismatchError  # Raised when a password doesn't match its hash.
+from werkzeug.security import check_password_hash  # Used to verify legacy Werkzeug password hashes.
 from google.cloud import storage  # Google Cloud Storage client for file storage.
 from google.cloud import firestore  # Google Cloud Firestore client for NoSQL database interactions.
-from google.cloud.firestore_v1.base_query import FieldFilter # Used for creating complex queries in Firestore.
-from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required, JWTManager  # Handles JSON Web Tokens (JWT) for authentication.
+from google.cloud.firestore_v1.base_query import FieldFilter, Or # Used for creating complex queries in Firestore.
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, jwt_required, JWTManager  # Handles JSON Web Tokens (JWT) for authentication.
+import google.auth  # Used to load the default service account credentials.
+import google.auth.credentials  # Used to check whether the active credentials can sign URLs locally.
+from google.auth.transport.requests import AuthorizedSession  # Authorized HTTP session shared by the GCS client.
+from requests.adapters import HTTPAdapter  # Used to size the GCS session's connection pool.
+from google.api_core import exceptions as google_exceptions  # Error types raised by Google Cloud client calls.
 from google.oauth2 import id_token  # Verifies Google OAuth2 ID tokens.
 from google.auth.transport import requests as google_requests  # Used to make requests for Google authentication.
 
@@ -46,6 +58,14 @@ app = Flask(__name__,
             static_folder=os.path.join(frontend_build_dir, 'static'),
             template_folder=frontend_build_dir)
 
+# Relative paths (with '/' separators) of every file in the React build, collected once at startup
+# so serving the frontend doesn't need a filesystem check per request. Empty if there is no build.
+frontend_build_files = frozenset(
+    os.path.relpath(os.path.join(root, filename), frontend_build_dir).replace(os.sep, '/')
+    for root, _, filenames in os.walk(frontend_build_dir)
+    for filename in filenames
+)
+
 
 
 # --- JWT Configuration ---
@@ -66,6 +86,10 @@ app.config['CONTENT_METADATA_DATABASE_ID'] = os.getenv('CONTENT_METADATA_DATABAS
 app.config['CONTENT_METADATA_COLLECTION_NAME'] = os.getenv('CONTENT_METADATA_COLLECTION_NAME')
 app.config['GEMINI_API_KEY'] = os.getenv('GEMINI_API_KEY')
 app.config['USER_DATABASE_ID'] = os.getenv('USER_DATABASE_ID')
+# When enabled, single-file downloads redirect to a signed GCS URL instead of being streamed
+# through the backend. Off by default: the browser must be allowed to follow the redirect to
+# storage.googleapis.com (bucket CORS policy), and signing requires service account credentials.
+app.config['SIGNED_URL_DOWNLOADS'] = os.getenv('SIGNED_URL_DOWNLOADS', 'false').lower() == 'true'
 
 
 
@@ -81,14 +105,70 @@ CORS(app, resources={r"/*": {"origins": cors_origins}}, supports_credentials=Tru
 
 # --- Initialize Google Cloud Clients ---
 # These clients are initialized once when the application starts.
+# Size of the HTTP connection pool shared by GCS calls across request threads.
+GCS_HTTP_POOL_SIZE = 32
 db = firestore.Client(database=app.config['USER_DATABASE_ID'])
 users_collection = db.collection('co-user-credentials')
 content_metadata_db = firestore.Client(database=app.config['CONTENT_METADATA_DATABASE_ID'])
-gcs_client = storage.Client()
+
+# The GCS client uses a shared, authorized HTTP session with a connection pool large enough
+# for the concurrent uploads/downloads below, so TLS connections are reused across requests.
+gcs_credentials, gcs_project = google.auth.default(scopes=storage.Client.SCOPE)
+gcs_session = AuthorizedSession(gcs_credentials)
+gcs_session.mount("https://", HTTPAdapter(pool_connections=GCS_HTTP_POOL_SIZE, pool_maxsize=GCS_HTTP_POOL_SIZE))
+gcs_client = storage.Client(project=gcs_project, credentials=gcs_credentials, _http=gcs_session)
+
+# Content metadata is stored in one collection group per category. The collection group
+# references are built once here; request handlers only add the per-user filters.
+CONTENT_CATEGORIES = ['images', 'videos', 'audios', 'others']
+content_collection_groups = {category: content_metadata_db.collection_group(category) for category in CONTENT_CATEGORIES}
+# Metadata fields returned to the frontend for each search result.
+SEARCH_RESULT_FIELDS = [
+    'enrichedMetadata.originalFileName',
+    'enrichedMetadata.contentType',
+    'enrichedMetadata.gcsPath',
+    'enrichedMetadata.userId',
+]
 logger.info("Successfully initialized all Google Cloud clients.")
 
+# Maximum number of concurrent GCS uploads per `/upload_files` request.
+UPLOAD_MAX_WORKERS = 8
+
+# Files larger than this are uploaded to GCS with a resumable upload in chunks of this size (8 MiB).
+# Smaller files are sent in a single request; 8 MiB is also the client library's multipart limit.
+UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Runs best-effort work that responses don't need to wait for, such as creating a new user's
+# GCS folders. Cloud Run (deployed without --no-cpu-throttling) gives this almost no CPU once the
+# response is sent and drops it if the instance scales down, so only submit work that may be lost.
+background_executor = ThreadPoolExecutor(max_workers=4)
+
+# Filename conflicts are found by listing the names that start with the file's base name, capped
+# at one page. If more names than this match, conflicts are resolved by probing candidate names
+# in batches of UPLOAD_PROBE_BATCH_SIZE instead.
+UPLOAD_LIST_LIMIT = 1000
+UPLOAD_PROBE_BATCH_SIZE = 8
+
+# Chunk size used when streaming blobs out of GCS (8 MiB).
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Maximum number of files downloaded concurrently (and held in memory) when building a ZIP archive.
+DOWNLOAD_MAX_WORKERS = 8
+
+# Worker-local cache of user lookups, keyed by ('id' | 'email' | 'google_id', value).
+# Entries expire after a minute, so no cross-worker invalidation is needed.
+_user_cache = TTLCache(maxsize=10000, ttl=60)
+_user_cache_lock = threading.Lock()
+
 
 # --- User Model ---
+# Shared Argon2id hasher. The library defaults use 64 MiB per hash; the container serves up to
+# 8 requests at once (one gunicorn worker, 8 threads) on Cloud Run's default memory, so use
+# OWASP's 19 MiB / 2 iterations / 1 lane profile instead (about 152 MiB for 8 concurrent hashes).
+# Existing hashes with other parameters are rehashed on the user's next login.
+password_hasher = PasswordHasher(time_cost=2, memory_cost=19 * 1024, parallelism=1)
+
+
 class User():
     """Represents a user in the system."""
     def __init__(self, id, email, username=None, google_id=None, profile_pic_url=None, password_hash=None):
@@ -128,87 +208,209 @@ class User():
 
     def set_password(self, password):
         """
-        Hashes and sets the user's password.
+        Hashes (with Argon2) and sets the user's password.
 
         Args:
             password (str): The plaintext password to hash.
         """
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
 
     def check_password(self, password):
         """
         Verifies a password against the stored hash.
 
+        Hashes created by Werkzeug (before the switch to Argon2), or with outdated
+        Argon2 parameters, are replaced with a fresh hash on successful verification;
+        the caller is responsible for saving the user afterwards.
+
         Args:
             password (str): The plaintext password to check.
 
         Returns:
             bool: True if the password is correct, False otherwise.
         """
-        if self.password_hash:
-            return check_password_hash(self.password_hash, password)
-        return False
+        if not self.password_hash:
+            return False
+        if not self.password_hash.startswith('$argon2'):
+            # Legacy Werkzeug hash (e.g. "pbkdf2:sha256:...").
+            if not check_password_hash(self.password_hash, password):
+                return False
+            self.set_password(password)
+            return True
+        try:
+            password_hasher.verify(self.password_hash, password)
+        except (VerifyMismatchError, InvalidHashError):
+            return False
+        if password_hasher.check_needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
 
 
 
 # --- Firestore Helper Functions (for user credentials) ---
-def get_user_from_db(user_id=None, email=None, google_id=None):
+def _lookup_user(cache_key, fetch):
     """
-    Retrieves a user from the Firestore database by ID, email, or Google ID.
+    Returns a user from the in-process cache, or fetches it from Firestore on a miss.
 
     Args:
-        user_id (str, optional): The user's unique ID.
-        email (str, optional): The user's email.
-        google_id (str, optional): The user's Google ID.
+        cache_key (tuple): The cache key, e.g. ('email', 'user@example.com').
+        fetch (callable): Performs the Firestore lookup and returns a User or None.
 
     Returns:
         User or None: The User object if found, otherwise None.
     """
+    # Misses (i.e. "not found") are cached too; failed lookups are not.
+    with _user_cache_lock:
+        if cache_key in _user_cache:
+            return _user_cache[cache_key]
+
     if not db:
         logger.error("Firestore DB (user credentials) not initialized. Cannot retrieve user.")
         return None
     try:
-        # Prioritize fetching by the unique user ID if provided.
-        if user_id:
-            doc_ref = users_collection.document(str(user_id))
-            doc = doc_ref.get()
-            if doc.exists:
-                return User(**doc.to_dict())
-            return None
-
-        # Build a query based on email or Google ID.
-        query_ref = None
-        if email:
-            query_ref = users_collection.where(filter=FieldFilter('email', '==', email)).limit(1)
-        elif google_id:
-            query_ref = users_collection.where(filter=FieldFilter('google_id', '==', google_id)).limit(1)
-
-        # Execute the query and return the user if found.
-        if query_ref:
-            docs = list(query_ref.stream())
-            if docs:
-                return User(**docs[0].to_dict())
-
+        user = fetch()
     except Exception as e:
-        logger.error(f"FATAL ERROR in get_user_from_db: {e}", exc_info=True)
+        logger.error(f"FATAL ERROR looking up user by {cache_key[0]}: {e}", exc_info=True)
+        return None
+
+    with _user_cache_lock:
+        _user_cache[cache_key] = user
+    return user
+
+
+def _query_single_user(field, value):
+    """
+    Queries the user collection for the first user whose `field` equals `value`.
+
+    Args:
+        field (str): The user document field to match.
+        value (str): The value to match.
+
+    Returns:
+        User or None: The User object if found, otherwise None.
+    """
+    # Take the first result and stop, rather than draining the stream into a list.
+    doc = next(iter(users_collection.where(filter=FieldFilter(field, '==', value)).limit(1).stream()), None)
+    if doc:
+        return User(**doc.to_dict())
     return None
 
 
-@jwt.user_lookup_loader
-def user_lookup_callback(_jwt_header, jwt_data):
+def get_user_by_id(user_id):
+    """
+    Retrieves a user from the Firestore database by their unique ID.
+
+    Args:
+        user_id (str): The user's unique ID.
+
+    Returns:
+        User or None: The User object if found, otherwise None.
+    """
+    def fetch():
+        doc = users_collection.document(str(user_id)).get()
+        if doc.exists:
+            return User(**doc.to_dict())
+        return None
+    return _lookup_user(('id', str(user_id)), fetch)
+
+
+def get_user_by_email(email):
+    """
+    Retrieves a user from the Firestore database by email.
+
+    Args:
+        email (str): The user's email.
+
+    Returns:
+        User or None: The User object if found, otherwise None.
+    """
+    return _lookup_user(('email', email), lambda: _query_single_user('email', email))
+
+
+def get_user_by_google_id(google_id):
     """
-    This function is called whenever a protected endpoint is accessed,
-    and it loads the user object from the database into the context.
+    Retrieves a user from the Firestore database by Google ID.
 
     Args:
-        _jwt_header (dict): The header of the JWT.
-        jwt_data (dict): The payload of the JWT.
+        google_id (str): The user's Google ID.
 
     Returns:
-        User or None: The user object corresponding to the JWT identity.
+        User or None: The User object if found, otherwise None.
     """
-    identity = jwt_data["sub"]
-    return get_user_from_db(user_id=identity)
+    return _lookup_user(('google_id', google_id), lambda: _query_single_user('google_id', google_id))
+
+
+def get_users_for_google_login(google_id, email):
+    """
+    Finds the users matching a Google sign-in with a single Firestore query.
+
+    Args:
+        google_id (str): The Google ID from the verified token.
+        email (str): The email from the verified token.
+
+    Returns:
+        tuple: (User or None, User or None) - the user with this Google ID, and a user
+        with this email (used to link an existing email account to Google).
+    """
+    if not db:
+        logger.error("Firestore DB (user credentials) not initialized. Cannot retrieve user.")
+        return None, None
+    google_user, email_user = None, None
+    try:
+        query_ref = users_collection.where(filter=Or([
+            FieldFilter('google_id', '==', google_id),
+            FieldFilter('email', '==', email),
+        ])).limit(2)
+        for doc in query_ref.stream():
+            user = User(**doc.to_dict())
+            if user.google_id == google_id:
+                google_user = google_user or user
+            elif user.email == email:
+                email_user = email_user or user
+    except Exception as e:
+        logger.error(f"FATAL ERROR in get_users_for_google_login: {e}", exc_info=True)
+    return google_user, email_user
+
+
+def get_user_from_db(user_id=None, email=None, google_id=None):
+    """
+    Retrieves a user from the Firestore database by ID, email, or Google ID.
+    Kept for compatibility; prefer the `get_user_by_*` functions.
+
+    Args:
+        user_id (str, optional): The user's unique ID.
+        email (str, optional): The user's email.
+        google_id (str, optional): The user's Google ID.
+
+    Returns:
+        User or None: The User object if found, otherwise None.
+    """
+    if user_id:
+        return get_user_by_id(user_id)
+    if email:
+        return get_user_by_email(email)
+    if google_id:
+        return get_user_by_google_id(google_id)
+    return None
+
+
+def get_current_user_email():
+    """
+    Returns the email of the user making the current authenticated request.
+
+    The email is read from the JWT claims, falling back to a database lookup
+    for tokens issued before the claim was added. No user lookup loader is registered
+    with the JWT manager, so protected routes that only need the email make no
+    Firestore request to authenticate.
+
+    Returns:
+        str or None: The user's email if available, otherwise None.
+    """
+    email = get_jwt().get('email')
+    if email:
+        return email
+    user = get_user_by_id(get_jwt_identity())
+    return user.email if user else None
 
 
 def save_user_to_db(user):
@@ -228,6 +430,13 @@ def save_user_to_db(user):
     except Exception as e:
         logger.error(f"Error saving user to Firestore (user credentials): {e}", exc_info=True)
         return
+    finally:
+        # Drop any cached lookups for this user so the next read sees the saved data.
+        with _user_cache_lock:
+            _user_cache.pop(('id', str(user.id)), None)
+            _user_cache.pop(('email', user.email), None)
+            if user.google_id:
+                _user_cache.pop(('google_id', user.google_id), None)
 
 
 # --- Google Cloud Storage Helper Functions ---
@@ -260,16 +469,142 @@ def create_user_gcs_folders(user_email, bucket_name):
     try:
         storage_client = get_gcs_client()
         bucket = storage_client.bucket(bucket_name)
-        # Create a placeholder object to represent a folder for each type.
-        for folder_type in ["images", "videos", "audios", "others"]:
-            blob = bucket.blob(f"{user_email}/{folder_type}/")
-            if not blob.exists():
-                blob.upload_from_string('', content_type='application/x-directory')
+
+        def create_folder(folder_type):
+            # Uploading an empty placeholder is idempotent, so no `exists()` check is needed.
+            bucket.blob(f"{user_email}/{folder_type}/").upload_from_string('', content_type='application/x-directory')
+
+        # Create a placeholder object to represent a folder for each type, concurrently.
+        with ThreadPoolExecutor(max_workers=len(CONTENT_CATEGORIES)) as executor:
+            list(executor.map(create_folder, CONTENT_CATEGORIES))
         logger.info(f"GCS folders created/verified for {user_email}.")
     except Exception as e:
         logger.error(f"Failed to create GCS folders for {user_email}: {e}", exc_info=True)
 
 
+class ZipStreamBuffer:
+    """
+    A minimal write-only file object that collects ZIP output so it can be streamed.
+
+    `zipfile.ZipFile` treats it as a non-seekable stream and writes each entry with a
+    trailing data descriptor, so the archive never has to be held in memory as a whole.
+    """
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        """
+        Returns and clears everything written since the last call.
+
+        Returns:
+            bytes: The buffered ZIP output.
+        """
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def find_available_blob_name(bucket, gcs_path_prefix, original_filename, taken_names, probe_gcs=False):
+    """
+    Finds a free blob name for an upload, appending a counter (e.g. "photo(2).jpg") on conflicts.
+
+    Args:
+        bucket (storage.Bucket): The bucket the file will be uploaded to.
+        gcs_path_prefix (str): The folder prefix for the blob, e.g. "user@example.com/images/".
+        original_filename (str): The uploaded file's name.
+        taken_names (set): Blob names known to be in use.
+        probe_gcs (bool): If True, `taken_names` is incomplete and names not in it are checked
+            against GCS. Candidates are probed concurrently in growing batches.
+
+    Returns:
+        str: The full blob name to upload to.
+    """
+    name, extension = os.path.splitext(original_filename)
+
+    def candidate(counter):
+        if counter == 0:
+            return f"{gcs_path_prefix}{original_filename}"
+        return f"{gcs_path_prefix}{name}({counter}){extension}"
+
+    if not probe_gcs:
+        counter = 0
+        while candidate(counter) in taken_names:
+            counter += 1
+        return candidate(counter)
+
+    def is_taken(blob_name):
+        return blob_name in taken_names or bucket.blob(blob_name).exists()
+
+    if not is_taken(candidate(0)):
+        return candidate(0)
+    # Probe candidates in parallel, doubling the batch each time every candidate is taken.
+    start, batch_size = 1, UPLOAD_PROBE_BATCH_SIZE
+    with ThreadPoolExecutor(max_workers=UPLOAD_PROBE_BATCH_SIZE) as executor:
+        while True:
+            candidates = [candidate(counter) for counter in range(start, start + batch_size)]
+            for blob_name, taken in zip(candidates, executor.map(is_taken, candidates)):
+                if not taken:
+                    return blob_name
+            start += batch_size
+            batch_size *= 2
+
+
+def map_uploaded_file(stream):
+    """
+    Memory-maps an uploaded file that Werkzeug has spooled to a temporary file on disk.
+
+    Args:
+        stream (file): The uploaded file's underlying stream.
+
+    Returns:
+        mmap.mmap or None: A read-only mapping of the whole file, or None if the upload
+        is held in memory and has no file descriptor.
+    """
+    try:
+        return mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def generate_download_url(blob, download_name):
+    """
+    Generates a short-lived V4 signed URL that downloads a blob as an attachment.
+
+    On Cloud Run the default credentials cannot sign locally, so the URL is signed
+    through the IAM `signBlob` API using the service account's access token
+    (requires the `iam.serviceAccountTokenCreator` role).
+
+    Args:
+        blob (storage.Blob): The blob to download.
+        download_name (str): The filename the browser should save the file as.
+
+    Returns:
+        str: The signed URL.
+    """
+    signing_kwargs = {}
+    credentials = gcs_credentials
+    if not isinstance(credentials, google.auth.credentials.Signing):
+        if not credentials.valid:
+            credentials.refresh(google_requests.Request())
+        signing_kwargs = {'service_account_email': credentials.service_account_email,
+                          'access_token': credentials.token}
+    safe_name = download_name.replace('"', '')
+    return blob.generate_signed_url(
+        version='v4',
+        expiration=timedelta(minutes=5),
+        method='GET',
+        response_disposition=f'attachment; filename="{safe_name}"',
+        **signing_kwargs
+    )
+
+
 # --- Main Route for serving the frontend ---
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -286,7 +621,7 @@ def serve_react_app(path):
     Returns:
         Response: The `index.html` of the React app or a specific static file if it exists.
     """
-    if path != "" and os.path.exists(os.path.join(app.static_folder, '..', path)):
+    if path != "" and path in frontend_build_files:
         return send_from_directory(os.path.join(app.static_folder, '..'), path)
     else:
         return render_template('index.html')
@@ -326,12 +661,12 @@ def google_login():
         email, name, picture = idinfo.get('email'), idinfo.get('name'), idinfo.get('picture')
         google_user_id = idinfo['sub']
 
-        # Check if a user with this Google ID already exists.
-        user = get_user_from_db(google_id=google_user_id)
+        # Look up users with this Google ID or with the same email (e.g., from email signup) in one query.
+        user, email_user = get_users_for_google_login(google_user_id, email)
 
-        # If no user with Google ID, check if a user with the same email exists (e.g., from email signup).
+        # If no user with Google ID, fall back to the user with the same email.
         if not user:
-            user = get_user_from_db(email=email)
+            user = email_user
             if user:
                 # Link the Google account to the existing email account.
                 user.google_id = google_user_id
@@ -343,11 +678,14 @@ def google_login():
             new_id = str(uuid.uuid4())
             user = User(id=new_id, email=email, username=name, google_id=google_user_id, profile_pic_url=picture)
             save_user_to_db(user)
-            # Create the necessary GCS folders for the new user.
-            create_user_gcs_folders(email, app.config['GCS_BUCKET_NAME'])
-
-        # Create a JWT for the user session.
-        access_token = create_access_token(identity=user.id)
+            # Create the new user's GCS placeholder folders in the background. This is best-effort:
+            # the task may never run on Cloud Run, which is fine since uploads create the objects'
+            # paths themselves and don't rely on the placeholders.
+            background_executor.submit(create_user_gcs_folders, email, app.config['GCS_BUCKET_NAME'])
+
+        # Create a JWT for the user session. The email is embedded as a claim so
+        # protected routes don't need a database lookup to recover it.
+        access_token = create_access_token(identity=user.id, additional_claims={'email': user.email})
         return jsonify(
             success=True,
             user={'email': user.email, 'name': user.username, 'picture': user.profile_pic_url},
@@ -378,10 +716,14 @@ def email_login():
     if not email or not password:
         return jsonify(success=False, error="Email and password are required."), 400
 
-    user = get_user_from_db(email=email)
+    user = get_user_by_email(email)
     # Check if the user exists and the password is correct.
+    previous_password_hash = user.password_hash if user else None
     if user and user.check_password(password):
-        access_token = create_access_token(identity=user.id)
+        # Persist the password hash if it was upgraded during verification.
+        if user.password_hash != previous_password_hash:
+            save_user_to_db(user)
+        access_token = create_access_token(identity=user.id, additional_claims={'email': user.email})
         return jsonify(
             success=True,
             user={'email': user.email, 'name': user.username, 'picture': user.profile_pic_url},
@@ -407,12 +749,13 @@ def upload_files():
         Multipart/form-data with one or more files under the key 'file'.
 
     Returns:
-        JSON: A success or error message, with a list of uploaded file names on success.
+        JSON: A success or error message, with the lists of uploaded and failed file names.
+        If no file could be uploaded, `success` is False with status 409 (every name was
+        taken by a concurrent upload) or 500.
     """
-    # Get the user ID from the JWT.
-    current_user_id = get_jwt_identity()
-    user = get_user_from_db(user_id=current_user_id)
-    if not user:
+    # Get the user's email from the JWT.
+    user_email = get_current_user_email()
+    if not user_email:
         return jsonify(success=False, error="User not found in database."), 401
 
     if 'file' not in request.files:
@@ -425,7 +768,10 @@ def upload_files():
     storage_client = get_gcs_client()
     bucket = storage_client.bucket(app.config['GCS_BUCKET_NAME'])
     uploaded_file_names = []
+    failed_file_names = []
+    pending_uploads = []  # (original filename, file content, destination blob name, MIME type) for each file to upload.
 
+    selected_files = []  # (file, MIME type, original filename, GCS folder prefix) for each file to upload.
     for file in files:
         if file.filename == '': continue
 
@@ -435,25 +781,81 @@ def upload_files():
         elif mime_type.startswith('video/'): subfolder_gcs = 'videos/'
         elif mime_type.startswith('audio/'): subfolder_gcs = 'audios/'
         else: subfolder_gcs = 'others/'
-
+        selected_files.append((file, mime_type, os.path.basename(file.filename), f"{user_email}/{subfolder_gcs}"))
+
+    def list_taken_names(name_prefix):
+        # Lists the names starting with a file's base name, which include every candidate
+        # ("name.ext", "name(n).ext") in use, instead of one `blob.exists()` request per candidate.
+        # Capped at one page; a longer listing means the names must be probed instead.
+        names = {b.name for b in storage_client.list_blobs(bucket, prefix=name_prefix, max_results=UPLOAD_LIST_LIMIT + 1)}
+        return names, len(names) > UPLOAD_LIST_LIMIT
+
+    # List the candidates for every distinct base name concurrently.
+    name_prefixes = {f"{gcs_path_prefix}{os.path.splitext(original_filename)[0]}"
+                     for _, _, original_filename, gcs_path_prefix in selected_files}
+    with ThreadPoolExecutor(max_workers=UPLOAD_MAX_WORKERS) as executor:
+        listings = dict(zip(name_prefixes, executor.map(list_taken_names, name_prefixes)))
+
+    reserved_blob_names = set()  # Names chosen for earlier files in this request.
+    for file, mime_type, original_filename, gcs_path_prefix in selected_files:
         # Handle potential filename conflicts by appending a counter.
-        original_filename = os.path.basename(file.filename)
-        name, extension = os.path.splitext(original_filename)
-        gcs_path_prefix = f"{user.email}/{subfolder_gcs}"
-        destination_blob_name = f"{gcs_path_prefix}{original_filename}"
-        counter = 1
-        while bucket.blob(destination_blob_name).exists():
-            new_filename = f"{name}({counter}){extension}"
-            destination_blob_name = f"{gcs_path_prefix}{new_filename}"
-            counter += 1
-
-        # Upload the file to GCS.
-        blob = bucket.blob(destination_blob_name)
+        taken_names, probe_gcs = listings[f"{gcs_path_prefix}{os.path.splitext(original_filename)[0]}"]
+        destination_blob_name = find_available_blob_name(
+            bucket, gcs_path_prefix, original_filename, taken_names | reserved_blob_names, probe_gcs)
+        # Reserve the chosen name so later files in the same request don't collide with it.
+        reserved_blob_names.add(destination_blob_name)
+
+        # Capture the file content up front, since the request's file streams are not thread-safe.
+        # Large files that Werkzeug spooled to disk are memory-mapped rather than copied into memory.
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
         file.seek(0)  # Rewind the file pointer to the beginning.
-        blob.upload_from_file(file, content_type=mime_type)
-        uploaded_file_names.append(os.path.basename(destination_blob_name))
+        data = map_uploaded_file(file.stream) if file_size > UPLOAD_CHUNK_SIZE else None
+        pending_uploads.append((original_filename, data if data is not None else file.read(),
+                                destination_blob_name, mime_type))
 
-    return jsonify(success=True, message=f'{len(uploaded_file_names)} file(s) uploaded successfully.', uploaded_files=uploaded_file_names), 200
+    def upload_blob(data, destination_blob_name, mime_type):
+        blob = bucket.blob(destination_blob_name)
+        # `if_generation_match=0` makes GCS reject the upload if the name was taken in the
+        # meantime, instead of silently overwriting another file.
+        if isinstance(data, mmap.mmap):
+            # Large file: resumable upload read straight from the mapped temp file, with bigger
+            # chunks than the library default to cut round-trips per file.
+            with data:
+                blob.chunk_size = UPLOAD_CHUNK_SIZE
+                blob.upload_from_file(data, size=len(data), content_type=mime_type, if_generation_match=0)
+            return
+        # In-memory content: small files go in a single multipart request, larger ones in chunks.
+        if len(data) > UPLOAD_CHUNK_SIZE:
+            blob.chunk_size = UPLOAD_CHUNK_SIZE
+        blob.upload_from_string(data, content_type=mime_type, if_generation_match=0)
+
+    # Upload the files to GCS concurrently; the uploads are I/O-bound and independent of each other.
+    with ThreadPoolExecutor(max_workers=UPLOAD_MAX_WORKERS) as executor:
+        futures = [(original_filename, destination_blob_name,
+                    executor.submit(upload_blob, data, destination_blob_name, mime_type))
+                   for original_filename, data, destination_blob_name, mime_type in pending_uploads]
+    conflicts = 0
+    for original_filename, destination_blob_name, future in futures:
+        try:
+            future.result()
+            uploaded_file_names.append(os.path.basename(destination_blob_name))
+        except google_exceptions.PreconditionFailed:
+            # Another request created a file with the same name after the conflict check.
+            logger.warning(f"Not uploading {destination_blob_name}: the name was taken during the upload.")
+            failed_file_names.append(original_filename)
+            conflicts += 1
+        except Exception as e:
+            logger.error(f"Failed to upload {destination_blob_name} to GCS: {e}", exc_info=True)
+            failed_file_names.append(original_filename)
+
+    if not uploaded_file_names:
+        # Nothing was stored: report a conflict if every file lost a naming race, otherwise a server error.
+        status = 409 if conflicts == len(failed_file_names) else 500
+        return jsonify(success=False, error=f"None of the {len(failed_file_names)} file(s) could be uploaded.",
+                       failed_files=failed_file_names), status
+    return jsonify(success=True, message=f'{len(uploaded_file_names)} file(s) uploaded successfully.',
+                   uploaded_files=uploaded_file_names, failed_files=failed_file_names), 200
 
 
 # --- Search Route ---
@@ -470,40 +872,42 @@ def search_files():
     Returns:
         JSON: A list of matching file metadata, including a public URL for each file.
     """
-    current_user_id = get_jwt_identity()
-    user = get_user_from_db(user_id=current_user_id)
-    if not user:
+    user_email = get_current_user_email()
+    if not user_email:
         return jsonify(success=False, error="User not found in database."), 404
 
     query_text = request.args.get('searchQuery', '').strip().lower()
     if not query_text:
         return jsonify(success=False, error="Search query is required."), 400
 
+    queries = []
+    # Build one query per content category, matching the user's files by either filename or
+    # extracted keyword (summaryContent). The OR filter lets Firestore union both in one query.
+    for collection_ref in content_collection_groups.values():
+        q = collection_ref.where(filter=FieldFilter('enrichedMetadata.userId', '==', user_email)) \
+            .where(filter=Or([
+                FieldFilter('enrichedMetadata.originalFileName', '==', query_text),
+                FieldFilter('enrichedMetadata.summaryContent', 'array_contains', query_text),
+            ]))
+        # Only fetch the fields the results page uses, rather than whole documents.
+        queries.append(q.select(SEARCH_RESULT_FIELDS))
+
+    # Run all queries concurrently so the search costs roughly one Firestore round-trip instead of one per query.
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = [executor.submit(lambda q=q: list(q.stream())) for q in queries]
+
     matching_docs = {}
-    categories = ['images', 'videos', 'audios', 'others']
-    # Iterate through all possible content categories.
-    for category in categories:
-        collection_ref = content_metadata_db.collection_group(category)
-        
-        # Search in both filenames and extracted keywords (summaryContent).
-        for query_type in ['filename', 'keywords']:
-            # Base query filtered by the current user's email.
-            q = collection_ref.where(filter=FieldFilter('enrichedMetadata.userId', '==', user.email))
-            if query_type == 'filename':
-                q = q.where(filter=FieldFilter('enrichedMetadata.originalFileName', '==', query_text))
-            else: # 'keywords'
-                q = q.where(filter=FieldFilter('enrichedMetadata.summaryContent', 'array_contains', query_text))
-            
-            # Add matching documents to a dictionary to avoid duplicates.
-            for doc in q.stream():
-                if doc.id not in matching_docs:
-                    doc_dict = doc.to_dict()
-                    gcs_path_raw = doc_dict.get('enrichedMetadata', {}).get('gcsPath')
-                    if gcs_path_raw:
-                        # Construct a public URL for the file.
-                        cleaned_gcs_path = gcs_path_raw.replace(f"gs://{app.config['GCS_BUCKET_NAME']}/", '', 1)
-                        doc_dict['publicUrl'] = f"https://storage.googleapis.com/{app.config['GCS_BUCKET_NAME']}/{cleaned_gcs_path}"
-                    matching_docs[doc.id] = doc_dict
+    for future in futures:
+        # Add matching documents to a dictionary to avoid duplicates.
+        for doc in future.result():
+            if doc.id not in matching_docs:
+                doc_dict = doc.to_dict()
+                gcs_path_raw = doc_dict.get('enrichedMetadata', {}).get('gcsPath')
+                if gcs_path_raw:
+                    # Construct a public URL for the file.
+                    cleaned_gcs_path = gcs_path_raw.replace(f"gs://{app.config['GCS_BUCKET_NAME']}/", '', 1)
+                    doc_dict['publicUrl'] = f"https://storage.googleapis.com/{app.config['GCS_BUCKET_NAME']}/{cleaned_gcs_path}"
+                matching_docs[doc.id] = doc_dict
     
     results = list(matching_docs.values())
     return jsonify(success=True, results=results, count=len(results)), 200
@@ -523,29 +927,37 @@ def get_frequent_keywords():
     user_id = get_jwt_identity()
     # The keywords are stored in a subcollection under the user's document.
     keywords_ref = db.collection('co-user-credentials').document(user_id).collection('keyword_counts')
-    query = keywords_ref.order_by('count', direction=firestore.Query.DESCENDING).limit(12)
+    query = keywords_ref.select(['keyword', 'count']).order_by('count', direction=firestore.Query.DESCENDING).limit(12)
     results = query.stream()
-    frequent_keywords = [{'name': doc.id, 'count': doc.to_dict().get('count', 0)} for doc in results]
+    # Document IDs are sanitized keywords, so show the original keyword when it is stored
+    frequent_keywords = []
+    for doc in results:
+        data = doc.to_dict()
+        frequent_keywords.append({'name': data.get('keyword', doc.id), 'count': data.get('count', 0)})
     return jsonify(success=True, keywords=frequent_keywords), 200
 
 
 # --- Download Routes ---
-@app.route('/download_single_file', methods=['POST'])
+@app.route('/download_single_file', methods=['GET', 'POST'])
 @jwt_required()
 def download_single_file():
     """
     Downloads a single file from GCS for the authenticated user.
 
-    Request Body (JSON):
+    Request Body (JSON), or query parameters for GET requests:
         {
             "fileUrl": "https://storage.googleapis.com/...",
             "originalFileName": "example.jpg"
         }
 
     Returns:
-        File: The requested file as an attachment.
+        Redirect or File: With SIGNED_URL_DOWNLOADS enabled, a 302 redirect to a signed GCS URL
+        that serves the file as an attachment; the bucket's CORS configuration must allow the
+        frontend origin, since the browser follows the redirect to storage.googleapis.com.
+        Otherwise, or if the URL cannot be signed, the file is streamed from GCS as an attachment,
+        honoring HTTP Range headers on GET requests so downloads can be resumed.
     """
-    data = request.get_json()
+    data = request.get_json(silent=True) or request.args
     file_url = data.get('fileUrl')
     original_filename = data.get('originalFileName')
     if not file_url or not original_filename:
@@ -557,10 +969,25 @@ def download_single_file():
     if f"https://storage.googleapis.com/{bucket_name}/" in file_url:
         blob_name = file_url.split(f"https://storage.googleapis.com/{bucket_name}/", 1)[1]
         bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(blob_name)
-        file_content = blob.download_as_bytes()
-        # Send the file content back to the client.
-        return send_file(io.BytesIO(file_content), mimetype=blob.content_type, as_attachment=True, download_name=original_filename)
+        if app.config['SIGNED_URL_DOWNLOADS']:
+            # Redirect the client to a short-lived signed URL so GCS serves the bytes directly.
+            try:
+                return redirect(generate_download_url(bucket.blob(blob_name), original_filename), code=302)
+            except Exception as e:
+                # E.g. user credentials in local development, which cannot sign URLs.
+                logger.warning(f"Could not sign a download URL for {blob_name}, streaming it instead: {e}")
+
+        # Fetch the blob's metadata (size, ETag) so the response can support Range requests.
+        blob = bucket.get_blob(blob_name)
+        if blob is None:
+            return jsonify(success=False, error="File not found."), 404
+        # Stream the file in chunks instead of loading it into memory.
+        response = send_file(blob.open('rb', chunk_size=DOWNLOAD_CHUNK_SIZE),
+                             mimetype=blob.content_type or 'application/octet-stream',
+                             as_attachment=True, download_name=original_filename,
+                             etag=blob.etag, last_modified=blob.updated, conditional=False)
+        response.content_length = blob.size
+        return response.make_conditional(request, accept_ranges=True, complete_length=blob.size)
     return jsonify(success=False, error="Invalid file URL provided."), 400
 
 
@@ -580,26 +1007,49 @@ def download_selected_files():
     if not file_urls:
         return jsonify(success=False, error="No file URLs provided."), 400
 
-    # Use an in-memory binary stream to build the ZIP file without writing to disk.
-    memory_file = io.BytesIO()
     storage_client = get_gcs_client()
     bucket_name = app.config['GCS_BUCKET_NAME']
     bucket = storage_client.bucket(bucket_name)
 
-    with zipfile.ZipFile(memory_file, 'w', zipfile.ZIP_DEFLATED) as zf:
-        for url in file_urls:
-            if f"https://storage.googleapis.com/{bucket_name}/" in url:
-                try:
-                    # Download each file and add it to the ZIP archive.
-                    blob_name = url.split(f"https://storage.googleapis.com/{bucket_name}/", 1)[1]
-                    blob = bucket.blob(blob_name)
-                    file_content = blob.download_as_bytes()
-                    zf.writestr(os.path.basename(blob_name), file_content)
-                except Exception as e:
-                    logger.error(f"Failed to add {url} to zip: {e}")
-    
-    memory_file.seek(0) # Rewind the memory file to the beginning before sending.
-    return send_file(memory_file, mimetype='application/zip', as_attachment=True, download_name='search_results.zip')
+    blob_names = [url.split(f"https://storage.googleapis.com/{bucket_name}/", 1)[1]
+                  for url in file_urls if f"https://storage.googleapis.com/{bucket_name}/" in url]
+
+    def download_blob(blob_name):
+        return bucket.blob(blob_name).download_as_bytes()
+
+    def generate_zip():
+        # Download files concurrently while writing them to the ZIP archive in their original order.
+        # At most DOWNLOAD_MAX_WORKERS files are in flight or waiting, which bounds memory use.
+        zip_stream = ZipStreamBuffer()
+        executor = ThreadPoolExecutor(max_workers=DOWNLOAD_MAX_WORKERS)
+        pending = deque()
+        names = iter(blob_names)
+        try:
+            with zipfile.ZipFile(zip_stream, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for blob_name in itertools.islice(names, DOWNLOAD_MAX_WORKERS):
+                    pending.append((blob_name, executor.submit(download_blob, blob_name)))
+                while pending:
+                    blob_name, future = pending.popleft()
+                    # Keep the prefetch window full before blocking on the next file.
+                    for next_name in itertools.islice(names, 1):
+                        pending.append((next_name, executor.submit(download_blob, next_name)))
+                    try:
+                        file_content = memoryview(future.result())
+                        with zf.open(os.path.basename(blob_name), 'w', force_zip64=True) as dest:
+                            for offset in range(0, len(file_content), DOWNLOAD_CHUNK_SIZE):
+                                dest.write(file_content[offset:offset + DOWNLOAD_CHUNK_SIZE])
+                                yield zip_stream.pop()
+                    except Exception as e:
+                        logger.error(f"Failed to add {blob_name} to zip: {e}")
+                    yield zip_stream.pop()
+            # Emit the central directory written when the archive is closed.
+            yield zip_stream.pop()
+        finally:
+            # Don't start downloads nobody will read if the client disconnects mid-stream.
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return Response(generate_zip(), mimetype='application/zip',
+                    headers={'Content-Disposition': 'attachment; filename=search_results.zip'})
 
 
 # --- Delete File Route ---
@@ -615,9 +1065,8 @@ def delete_file():
     Returns:
         JSON: A success or error message.
     """
-    current_user_id = get_jwt_identity()
-    user = get_user_from_db(user_id=current_user_id)
-    if not user:
+    user_email = get_current_user_email()
+    if not user_email:
         return jsonify(success=False, error="User not found."), 404
 
     filename_to_delete = request.json.get('filename')
@@ -626,14 +1075,18 @@ def delete_file():
 
     doc_ref_to_delete, gcs_path = None, None
     # Find the file's metadata document in Firestore to get its GCS path.
-    categories = ['images', 'videos', 'audios', 'others']
-    for category in categories:
-        query = content_metadata_db.collection_group(category) \
-            .where(filter=FieldFilter('enrichedMetadata.userId', '==', user.email)) \
+    # All categories are queried concurrently; the first match in category order wins.
+    queries = [
+        collection_ref
+            .where(filter=FieldFilter('enrichedMetadata.userId', '==', user_email))
             .where(filter=FieldFilter('enrichedMetadata.originalFileName', '==', filename_to_delete)).limit(1)
-        docs = list(query.stream())
-        if docs:
-            doc_snapshot = docs[0]
+        for collection_ref in content_collection_groups.values()
+    ]
+    with ThreadPoolExecutor(max_workers=len(queries)) as executor:
+        futures = [executor.submit(lambda q=q: next(iter(q.stream()), None)) for q in queries]
+    for future in futures:
+        doc_snapshot = future.result()
+        if doc_snapshot:
             doc_ref_to_delete = doc_snapshot.reference
             gcs_path = doc_snapshot.to_dict().get('enrichedMetadata', {}).get('gcsPath')
             break
@@ -647,10 +1100,14 @@ def delete_file():
     blob_name = gcs_path.replace(f'gs://{bucket_name}/', '')
     bucket = storage_client.bucket(bucket_name)
     blob = bucket.blob(blob_name)
-    if blob.exists():
+
+    # Delete directly rather than checking `exists()` first; a missing blob is not an error.
+    try:
         blob.delete()
-    
-    # Delete the metadata document from Firestore.
+    except google_exceptions.NotFound:
+        logger.warning(f"Blob {blob_name} was already missing from GCS.")
+    # Delete the metadata document only once the blob is gone, so a failed blob delete
+    # leaves the file visible in the UI and the deletion can be retried.
     doc_ref_to_delete.delete()
     return jsonify(success=True, message=f"File '{filename_to_delete}' deleted successfully."), 200
 
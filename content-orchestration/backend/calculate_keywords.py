@@ -19,11 +19,22 @@
     Environment Variables (loaded via .env):
     - GOOGLE_APPLICATION_CREDENTIALS_PATH: Path to GCP service account credentials file.
     - USER_DATABASE_ID: Firestore database ID for user credentials.
-    - CONTENT_METADATA_DATABASE_ID: Firestore database ID for content metadata."""
+    - CONTENT_METADATA_DATABASE_ID: Firestore database ID for content metadata.
+    - USER_MAP_CACHE_PATH (optional): Where to cache the email -> user ID map between runs."""
 
 import os
+import asyncio  # For scanning the content collection groups concurrently
+import hashlib  # For disambiguating sanitized keyword document IDs
+import json  # For reading and writing the user map cache
+import time  # For checking the user map cache's age
+import tempfile  # For writing the user map cache atomically
 import logging  # For logging info, warnings, and errors
+from pathlib import Path
+from contextlib import contextmanager  # For timing each phase of the aggregation
 from collections import Counter, defaultdict  # For keyword frequency counting
+from itertools import repeat  # For pairing a user's email with each of their keywords
+from sys import intern  # For sharing one string object per distinct keyword
+from concurrent.futures import ThreadPoolExecutor, as_completed  # For committing in parallel
 # --- Google Cloud Firestore Imports ---
 from google.cloud import firestore
 from google.cloud.firestore_v1.base_query import FieldFilter
@@ -45,9 +56,301 @@ CONTENT_DB_ID = os.getenv('CONTENT_METADATA_DATABASE_ID')
 # Firestore collection groups to scan for content metadata
 COLLECTION_GROUPS_TO_QUERY = ['images', 'videos', 'audios', 'others']
 
+# Content metadata fields read during the scan (dotted paths into nested maps)
+SCANNED_FIELDS = ['enrichedMetadata.userId', 'enrichedMetadata.summaryContent']
+
+# Progress is logged every 16384 documents scanned per group (a power of two, checked with a bitmask)
+SCAN_PROGRESS_LOG_MASK = 0x3FFF
+
 # Subcollection under each user document to store keyword counts
 TARGET_SUBCOLLECTION_NAME = 'keyword_counts'
 
+# Local cache of the email -> user document ID map, reused across runs within the TTL
+USER_MAP_CACHE_PATH = Path(os.getenv('USER_MAP_CACHE_PATH', '/tmp/co_user_map.json'))
+USER_MAP_CACHE_TTL_SECONDS = 3600
+
+# Number of users whose stored keyword counts are read in parallel
+COMMIT_MAX_WORKERS = 20
+
+# Attempts per keyword write before BulkWriter gives up (the library's default retry limit)
+BULK_WRITE_MAX_ATTEMPTS = 15
+
+# Firestore document IDs may be at most 1500 bytes
+MAX_DOC_ID_BYTES = 1500
+
+def keyword_doc_id(keyword):
+    """
+    Build the 'keyword_counts' document ID for a keyword.
+
+    Only what Firestore rejects is changed: '/' is replaced, the IDs '.' and '..' and
+    reserved '__...__' IDs are escaped, and the ID is clamped to Firestore's size limit.
+    Any ID that differs from its keyword gets a short hash of the keyword appended, so
+    distinct keywords never share a document.
+    """
+    doc_id = keyword.replace('/', '_')
+    if doc_id in ('.', '..'):
+        doc_id = doc_id.replace('.', '_')
+    elif doc_id.startswith('__') and doc_id.endswith('__'):
+        doc_id = doc_id[1:]
+    encoded = doc_id.encode('utf-8')
+    if doc_id == keyword and len(encoded) <= MAX_DOC_ID_BYTES:
+        return doc_id
+    suffix = '~' + hashlib.sha1(keyword.encode('utf-8')).hexdigest()[:12]
+    return encoded[:MAX_DOC_ID_BYTES - len(suffix)].decode('utf-8', 'ignore') + suffix
+
+def load_user_map(users_ref):
+    """
+    Load the mapping of user email -> user document ID.
+
+    The map is read from USER_MAP_CACHE_PATH if it was written less than
+    USER_MAP_CACHE_TTL_SECONDS ago for the same user database; otherwise the user
+    collection is scanned once (fetching only the email field) and the cache is rewritten.
+    The cache holds every user's email, so it is written owner-only (0600) and atomically,
+    and a cache file owned by another user is never read.
+
+    Args:
+        users_ref: The 'co-user-credentials' collection reference.
+
+    Returns:
+        tuple: (dict mapping email to document ID, bool indicating whether it came from the cache).
+    """
+    try:
+        with open(USER_MAP_CACHE_PATH) as f:
+            # Check the opened file itself, so it cannot be swapped between the check and the read
+            cache_stat = os.fstat(f.fileno())
+            if cache_stat.st_uid != os.getuid():
+                logger.warning(f"Ignoring user map cache {USER_MAP_CACHE_PATH}: it is owned by another user.")
+            elif time.time() - cache_stat.st_mtime < USER_MAP_CACHE_TTL_SECONDS:
+                cached = json.load(f)
+                if cached.get('database') == USER_DB_ID:
+                    logger.info(f"Loaded user map from cache: {USER_MAP_CACHE_PATH}")
+                    return cached['users'], True
+    except (OSError, ValueError, KeyError) as e:
+        logger.info(f"User map cache not used: {e}")
+
+    user_map = {doc.to_dict().get('email'): doc.id for doc in users_ref.select(['email']).stream()}
+    user_map.pop(None, None)  # Ignore user documents without an email
+    try:
+        # mkstemp creates the file with mode 0600; os.replace swaps it in atomically
+        fd, tmp_path = tempfile.mkstemp(dir=USER_MAP_CACHE_PATH.parent, prefix='.co_user_map.')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'database': USER_DB_ID, 'users': user_map}, f)
+            os.replace(tmp_path, USER_MAP_CACHE_PATH)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        logger.warning(f"Could not write user map cache {USER_MAP_CACHE_PATH}: {e}")
+    return user_map, False
+
+def find_user_doc_id(users_ref, user_email):
+    """
+    Look up a single user's document ID by email.
+
+    Args:
+        users_ref: The 'co-user-credentials' collection reference.
+        user_email (str): The email to look up.
+
+    Returns:
+        str or None: The user's document ID, or None if no user has that email.
+    """
+    user_doc = next(iter(users_ref.where(filter=FieldFilter('email', '==', user_email)).limit(1).stream()), None)
+    return user_doc.id if user_doc else None
+
+@contextmanager
+def timed(phase):
+    """Logs how long the wrapped phase of the aggregation took."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        logger.info(f"Phase '{phase}' took {time.perf_counter() - start:.2f}s")
+
+def build_clients():
+    """
+    Create the Firestore clients from the service account credentials.
+
+    Returns:
+        tuple: (sync client for the user database, async client for the content database).
+            The content scan runs on asyncio so network waits overlap with counting.
+    """
+    creds = ServiceAccountCredentials.from_service_account_file(CREDENTIALS_PATH)
+    user_db = firestore.Client(credentials=creds, database=USER_DB_ID)
+    content_db = firestore.AsyncClient(credentials=creds, database=CONTENT_DB_ID)
+    return user_db, content_db
+
+async def scan_group(content_db, group):
+    """
+    Count (user email, keyword) pairs in one content collection group.
+
+    Args:
+        content_db: The async client for the content metadata database.
+        group (str): The collection group to scan.
+
+    Returns:
+        tuple: (flat Counter keyed by (email, keyword), documents scanned, documents skipped).
+    """
+    logger.info(f"--- Querying collection group: '{group}' ---")
+    # A single flat Counter keyed by (email, keyword) needs one hash lookup per keyword
+    local_counter = Counter()
+    files_processed = 0
+    files_skipped = 0  # Documents without a user or any usable keyword (e.g. not enriched yet)
+    # Only fetch the two fields used below instead of whole documents
+    docs = content_db.collection_group(group).select(SCANNED_FIELDS).stream()
+    async for doc in docs:
+        files_processed += 1
+        if not files_processed & SCAN_PROGRESS_LOG_MASK:
+            logger.info(f"Scanned {files_processed} documents in '{group}'...")
+        # Read the two fields straight off the snapshot instead of building the whole dict,
+        # skipping the document as soon as either one is missing or empty
+        # Your search code confirms userId is stored as the user's email
+        try:
+            user_email = doc.get('enrichedMetadata.userId')
+            keywords = doc.get('enrichedMetadata.summaryContent') if user_email else None
+        except KeyError:
+            keywords = None
+        if not keywords or not isinstance(keywords, list):
+            files_skipped += 1
+            continue
+
+        # Drop sentinel entries such as '' or None. Keywords repeat heavily across documents,
+        # so they are interned to keep a single string object per distinct keyword in every counter
+        keywords = [intern(k) for k in keywords if isinstance(k, str) and k]
+        if not keywords:
+            files_skipped += 1
+            continue
+
+        # Add counts for this user's keywords; zip/repeat build the (email, keyword) keys in C
+        local_counter.update(zip(repeat(user_email), keywords))
+    return local_counter, files_processed, files_skipped
+
+async def scan_content(content_db, users_ref):
+    """
+    Count keywords per user across every content collection group.
+
+    All groups are scanned concurrently on one event loop, and each group's counts are
+    folded into the per-user counters as soon as that group finishes. The email -> user ID
+    map (from the local cache if it is fresh) is loaded on a worker thread meanwhile, so
+    counts are keyed by user document ID and emails without a user are dropped.
+
+    Args:
+        content_db: The async client for the content metadata database.
+        users_ref: The 'co-user-credentials' collection reference.
+
+    Returns:
+        tuple: (dict of user document ID -> keyword Counter, documents scanned, documents skipped).
+    """
+    # Use defaultdict to easily create a new Counter for each new user
+    user_keyword_counters = defaultdict(Counter)
+    total_files_processed = 0
+    total_files_skipped = 0
+
+    user_map_task = asyncio.ensure_future(asyncio.to_thread(load_user_map, users_ref))
+    # Start the scans as tasks right away; as_completed only schedules bare coroutines once iterated
+    scan_tasks = [asyncio.ensure_future(scan_group(content_db, group)) for group in COLLECTION_GROUPS_TO_QUERY]
+    user_map, user_map_from_cache = await user_map_task
+    for next_scan in asyncio.as_completed(scan_tasks):
+        local_counter, files_processed, files_skipped = await next_scan
+        total_files_processed += files_processed
+        total_files_skipped += files_skipped
+        # Pivot this group's flat counts into one Counter per user, then drop them
+        for (user_email, keyword), count in local_counter.items():
+            if user_email not in user_map:
+                # The cached map may predate this user; look them up directly, once
+                user_map[user_email] = (await asyncio.to_thread(find_user_doc_id, users_ref, user_email)
+                                        if user_map_from_cache else None)
+                if not user_map[user_email]:
+                    logger.warning(f"Could not find user document for email: {user_email}. Skipping.")
+            user_doc_id = user_map[user_email]
+            if user_doc_id:
+                user_keyword_counters[user_doc_id][keyword] += count
+        del local_counter
+    return user_keyword_counters, total_files_processed, total_files_skipped
+
+def diff_user_counts(users_ref, user_doc_id, counter):
+    """
+    Work out the writes needed to bring one user's stored keyword counts up to date.
+
+    Only keywords whose count differs from the stored one are written, and stored
+    keywords that no longer appear in the user's content are deleted. Nothing is
+    written here; the caller applies the returned operations.
+
+    Args:
+        users_ref: The 'co-user-credentials' collection reference.
+        user_doc_id (str): The user's document ID.
+        counter (Counter): The user's keyword counts.
+
+    Returns:
+        tuple: (list of (document reference, data) pairs to set, list of document references to delete).
+    """
+    logger.info(f"Updating keyword counts for user ID: {user_doc_id}")
+    user_keywords_subcollection_ref = users_ref.document(user_doc_id).collection(TARGET_SUBCOLLECTION_NAME)
+
+    # Fetch the currently stored counts so only changed keywords are written
+    existing_counts = {doc.id: doc.get('count')
+                       for doc in user_keywords_subcollection_ref.select(['count']).stream()}
+
+    sets = []
+    written_doc_ids = set()
+    # Bind the per-keyword methods to locals once, outside the loop
+    add_written, get_existing = written_doc_ids.add, existing_counts.get
+    document, add_set = user_keywords_subcollection_ref.document, sets.append
+    for keyword, count in counter.items():
+        doc_id = keyword_doc_id(keyword)
+        add_written(doc_id)
+        if get_existing(doc_id) == count:
+            continue
+        add_set((document(doc_id), {'keyword': keyword, 'count': count}))
+
+    # Remove counts for keywords that no longer appear in any of the user's content
+    deletes = [document(doc_id) for doc_id in existing_counts.keys() - written_doc_ids]
+    return sets, deletes
+
+def write_counts(user_db, users_ref, user_keyword_counters):
+    """
+    Save every user's keyword counts into their 'keyword_counts' subcollection.
+
+    Users' stored counts are read in parallel since their subcollections are independent.
+    The resulting writes are all queued from this thread on a single BulkWriter, which is
+    not thread-safe; it batches, rate-limits and retries them, splitting writes into its own
+    small batches so users with more than 500 keywords never hit the WriteBatch mutation limit.
+
+    Args:
+        user_db: The client for the user database.
+        users_ref: The 'co-user-credentials' collection reference.
+        user_keyword_counters (dict): User document ID -> keyword Counter.
+    """
+    bulk_writer = user_db.bulk_writer()
+    failed_writes = []  # Paths that could not be written; appended from the writer's threads
+
+    def on_write_error(error, _bulk_writer):
+        """Retries a failed write like BulkWriter's default handler, logging it once retries run out."""
+        if error.attempts < BULK_WRITE_MAX_ATTEMPTS:
+            return True
+        failed_writes.append(error.operation.reference.path)
+        logger.error(f"Failed to write {error.operation.reference.path} after {error.attempts} attempts: "
+                     f"{error.code} {error.message}")
+        return False
+
+    bulk_writer.on_write_error(on_write_error)
+    with ThreadPoolExecutor(max_workers=COMMIT_MAX_WORKERS) as executor:
+        futures = {executor.submit(diff_user_counts, users_ref, user_doc_id, counter): user_doc_id
+                   for user_doc_id, counter in user_keyword_counters.items()}
+        for future in as_completed(futures):
+            try:
+                sets, deletes = future.result()
+            except Exception as e:
+                logger.error(f"Failed to save keyword counts for user ID {futures[future]}: {e}", exc_info=True)
+                continue
+            for doc_ref, data in sets:
+                bulk_writer.set(doc_ref, data)
+            for doc_ref in deletes:
+                bulk_writer.delete(doc_ref)
+    bulk_writer.close() # Flush all pending writes and wait for them to complete
+    if failed_writes:
+        logger.error(f"{len(failed_writes)} keyword count write(s) failed; see the errors above.")
+
 def aggregate_keywords_per_user():
     """
     Aggregate keyword counts per user and store them in Firestore.
@@ -55,7 +358,8 @@ def aggregate_keywords_per_user():
     Process:
     - Connects to Firestore using service account credentials.
     - Queries content metadata collections (images, videos, audios, others).
-    - Extracts keywords from 'enrichedMetadata.summaryContent' and groups them by user email.
+    - Extracts keywords from 'enrichedMetadata.summaryContent' and groups them by user,
+      resolving each user email to its document ID and dropping unknown users.
     - Counts keyword frequency per user.
     - Saves results in each user's 'keyword_counts' subcollection.
 
@@ -76,36 +380,20 @@ def aggregate_keywords_per_user():
 
     logger.info("Initializing Firestore clients for both user and content databases...")
     try: 
-        creds = ServiceAccountCredentials.from_service_account_file(CREDENTIALS_PATH)
-        user_db = firestore.Client(credentials=creds, database=USER_DB_ID)
-        content_db = firestore.Client(credentials=creds, database=CONTENT_DB_ID)
+        user_db, content_db = build_clients()
         logger.info("Successfully connected to both Firestore databases.")
     except Exception as e:
         logger.error(f"FATAL: Could not connect to Firestore. Error: {e}", exc_info=True)
         return
+    users_ref = user_db.collection('co-user-credentials')
 
-    # 1. Count keywords per user email from the content metadata
-    # Use defaultdict to easily create a new Counter for each new user
-    user_keyword_counters = defaultdict(Counter)
-    total_files_processed = 0
-
-    for group in COLLECTION_GROUPS_TO_QUERY:
-        logger.info(f"--- Querying collection group: '{group}' ---")
-        docs = content_db.collection_group(group).stream()
-        for doc in docs:
-            total_files_processed += 1
-            data = doc.to_dict()
-            
-            enriched_metadata = data.get('enrichedMetadata', {})
-            # Your search code confirms userId is stored as the user's email
-            user_email = enriched_metadata.get('userId')
-            keywords = enriched_metadata.get('summaryContent', [])
-
-            if user_email and isinstance(keywords, list) and keywords:
-                # Add counts to the specific user's counter
-                user_keyword_counters[user_email].update(keywords)
+    # 1. Count keywords per user from the content metadata
+    with timed('scan'):
+        user_keyword_counters, total_files_processed, total_files_skipped = asyncio.run(
+            scan_content(content_db, users_ref))
     
-    logger.info(f"=== Processed {total_files_processed} files across {len(user_keyword_counters)} users. ===")
+    logger.info(f"=== Processed {total_files_processed} files across {len(user_keyword_counters)} users "
+                f"({total_files_skipped} files had no user or keywords). ===")
 
     if not user_keyword_counters:
         logger.warning("No keywords found to process.")
@@ -113,30 +401,8 @@ def aggregate_keywords_per_user():
 
     # 2. Save the aggregated counts into each user's subcollection
     logger.info("Saving aggregated counts to user-specific subcollections...")
-    users_ref = user_db.collection('co-user-credentials')
-
-    for user_email, counter in user_keyword_counters.items():
-        # Find the user's document ID from their email
-        user_query = users_ref.where(filter=FieldFilter('email', '==', user_email)).limit(1).stream()
-        user_doc_list = list(user_query)
-
-        if not user_doc_list:
-            logger.warning(f"Could not find user document for email: {user_email}. Skipping.")
-            continue
-        
-        user_doc_id = user_doc_list[0].id
-        logger.info(f"Updating keyword counts for user: {user_email} (ID: {user_doc_id})")
-
-        # Create a batch write for this specific user's subcollection
-        batch = user_db.batch()
-        user_keywords_subcollection_ref = users_ref.document(user_doc_id).collection(TARGET_SUBCOLLECTION_NAME)
-
-        for keyword, count in counter.items():
-            doc_id = keyword.replace('/', '_')  # Replace '/' to avoid Firestore doc ID conflicts
-            doc_ref = user_keywords_subcollection_ref.document(doc_id)
-            batch.set(doc_ref, {'keyword': keyword, 'count': count})
-        
-        batch.commit() # Commit batch updates
+    with timed('write'):
+        write_counts(user_db, users_ref, user_keyword_counters)
 
     logger.info("User-specific aggregation complete!")
 
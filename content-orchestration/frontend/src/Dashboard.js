@@ -195,7 +195,10 @@ const Dashboard = () => {
                 headers: { Authorization: `Bearer ${token}` },
             });
             const data = await res.json();
-            if (res.ok && data.success) {
+            if (res.ok && data.success && data.failed_files?.length) {
+                setUploadMessage(`Some files failed to upload: ${data.failed_files.join(', ')}`);
+                clearSelectedFile();
+            } else if (res.ok && data.success) {
                 setUploadMessage('Files uploaded successfully!');
                 clearSelectedFile();
             } else {